@@ -1,41 +1,53 @@
 from time import time as currenttime
 from ortools.sat.python import cp_model
+import os
 import re
 import itertools
 import numpy as np
-import numpy
-import tkinter as tk  
-from tkinter import ttk  
-from tkinter import filedialog, messagebox, scrolledtext  
-import matplotlib.pyplot as plt
-import psutil 
+# tkinter, matplotlib and psutil are imported inside the functions that use them,
+# so read_file/Solver can be scripted headless without their import cost
+
+# Precompiled patterns for the instance file parser
+_RE_AUTH = re.compile(r"Authorisations u(\d+)(?: s\d+)*")
+_RE_SOD = re.compile(r"Separation-of-duty s(\d+) s(\d+)")
+_RE_BOD = re.compile(r"Binding-of-duty s(\d+) s(\d+)")
+_RE_AMK = re.compile(r"At-most-k (\d+)((?: s\d+)+)")
+_RE_ONETEAM = re.compile(r"One-team\s+(s\d+)(?: s\d+)* (\((u\d+)*\))*")
+_RE_TEAM = re.compile(r'\((u\d+\s*)+\)')
+_RE_STEP = re.compile(r's(\d+)')
+_RE_USER = re.compile(r'u(\d+)')
+
+# psutil handle on this process, created on the first Solver call and reused afterwards
+_PROC = None
 
 # Helper function to format the solver output
 def transform_output(d):
     crlf = '\r\n'
     status = "Status: Satisfiable" if d['sat'] == 'sat' else "Status: Unsatisfiable"
-    s = ''.join(kk + crlf for kk in d['sol'])
-    s = status + crlf + s + d['mul_sol']
+    lines = [status, *d['sol'], d['mul_sol']]
     memory = f"Memory Usage: {d['memory_usage']}"
-    return crlf + s + crlf + d['exe_time'] + crlf + memory if 'exe_time' in d else s
+    if 'exe_time' in d:
+        return crlf + crlf.join(lines + [d['exe_time'], memory])
+    return crlf.join(lines)
 
 # Callback class for printing intermediate solutions
 class VarArraySolutionPrinter(cp_model.CpSolverSolutionCallback):
-    """Print intermediate solutions."""
-    def __init__(self, variables, limit):
+    """Count intermediate solutions, printing each one when verbose."""
+    def __init__(self, variables, limit, verbose=True):
         cp_model.CpSolverSolutionCallback.__init__(self)
         self.__variables = variables
         self.__solution_count = 0
         self.__solution_limit = limit
+        self.__verbose = verbose
 
     def on_solution_callback(self):
         self.__solution_count += 1
-        # Print each solution found
-        for v in self.__variables:
-            for user in range(len(v)):
-                if self.Value(v[user]) == 1:
-                    print(f'[{v[user]}]', end=' ')
-        print()
+        # Print each solution found as one line of step-to-user assignments
+        if self.__verbose:
+            for step, v in enumerate(self.__variables):
+                values = [self.Value(var) for var in v]
+                print(f'[s{step + 1}: u{values.index(1) + 1}]', end=' ')
+            print()
         if self.__solution_count >= self.__solution_limit:
             print(f'\nStop searching after {self.__solution_limit} solutions found')
             self.StopSearch()
@@ -49,7 +61,7 @@ class Instance:
         self.number_of_steps = 0
         self.number_of_users = 0
         self.number_of_constraints = 0
-        self.auth = []  # List of steps authorized for each user
+        self.auth = []  # Set of steps authorized for each user
         self.SOD = []   # Separation-of-duty constraints
         self.BOD = []   # Binding-of-duty constraints
         self.at_most_k = []  # At-most-k constraints
@@ -72,48 +84,45 @@ def read_file(filename):
         instance.number_of_users = read_attribute("#Users")
         instance.number_of_constraints = read_attribute("#Constraints")
 
-        instance.auth = [[] for _ in range(instance.number_of_users)]
+        instance.auth = [set() for _ in range(instance.number_of_users)]
 
-        # Parse constraints
-        for _ in range(instance.number_of_constraints):
-            l = f.readline()
+        # Parse constraints (the remaining lines are read in one go)
+        lines = f.read().splitlines()
+        for l in lines[:instance.number_of_constraints]:
 
             # Parse authorizations
-            if m := re.match(r"Authorisations u(\d+)(?: s\d+)*", l):
+            if m := _RE_AUTH.match(l):
                 user_id = int(m.group(1))
-                steps = [-1]
-                for m in re.finditer(r's(\d+)', l):
-                    if -1 in steps:
-                        steps.remove(-1)
-                    steps.append(int(m.group(1)) - 1)
-                instance.auth[user_id - 1].extend(steps)
+                # A user listed without steps is authorised for none (marked by -1)
+                steps = [int(step) - 1 for step in _RE_STEP.findall(l)] or [-1]
+                instance.auth[user_id - 1].update(steps)
                 continue
             
             # Parse Separation-of-Duty constraints
-            if m := re.match(r"Separation-of-duty s(\d+) s(\d+)", l):
+            if m := _RE_SOD.match(l):
                 steps = (int(m.group(1)) - 1, int(m.group(2)) - 1)
                 instance.SOD.append(steps)
                 continue
             
             #Parse Binding-of-Duty constraints
-            if m := re.match(r"Binding-of-duty s(\d+) s(\d+)", l):
+            if m := _RE_BOD.match(l):
                 steps = (int(m.group(1)) - 1, int(m.group(2)) - 1)
                 instance.BOD.append(steps)
                 continue
             
             # Parse At-most-k constraints
-            if m := re.match(r"At-most-k (\d+)((?: s\d+)+)", l):
+            if m := _RE_AMK.match(l):
                 k = int(m.group(1))
-                steps = [int(step) - 1 for step in re.findall(r's(\d+)', m.group(2))]
+                steps = [int(step) - 1 for step in _RE_STEP.findall(m.group(2))]
                 instance.at_most_k.append((k, steps))
                 continue
 
             # Parse One-Team constraints
-            if m := re.match(r"One-team\s+(s\d+)(?: s\d+)* (\((u\d+)*\))*", l):
-                steps = [int(m.group(1)) - 1 for m in re.finditer(r's(\d+)', l)]
+            if m := _RE_ONETEAM.match(l):
+                steps = [int(step) - 1 for step in _RE_STEP.findall(l)]
                 teams = []
-                for m in re.finditer(r'\((u\d+\s*)+\)', l):
-                    team = [int(users.group(1)) - 1 for users in re.finditer(r'u(\d+)', m.group(0))]
+                for m in _RE_TEAM.finditer(l):
+                    team = [int(user) - 1 for user in _RE_USER.findall(m.group(0))]
                     teams.append(team)
                 instance.one_team.append((steps, teams))
                 continue
@@ -137,30 +146,34 @@ def Solver(instance, filename):
     print("=====================================================")
 
     model = cp_model.CpModel()
-    user_assignment = [[model.NewBoolVar(f's{s + 1}: u{u + 1}') for u in range(instance.number_of_users)] for s in range(instance.number_of_steps)]
+
+    # Users authorised for each step (users with no authorisation rule may perform any step)
+    authorised_users = [{user for user in range(instance.number_of_users) if not instance.auth[user] or step in instance.auth[user]} for step in range(instance.number_of_steps)]
+
+    # Authorization constraints
+    # A variable is only created for authorised (step, user) slots; every other slot is the constant 0
+    zero = model.NewConstant(0)
+    user_assignment = [[model.NewBoolVar(f's{s + 1}: u{u + 1}') if u in authorised_users[s] else zero for u in range(instance.number_of_users)] for s in range(instance.number_of_steps)]
     
     # Step-to-user assignment constraints
     for step in range(instance.number_of_steps):
-        model.AddExactlyOne(user_assignment[step][user] for user in range(instance.number_of_users))
-
-    # Authorization constraints
-    for user in range(instance.number_of_users):
-        if instance.auth[user]:
-            for step in range(instance.number_of_steps):
-                if step not in instance.auth[user]:
-                    model.Add(user_assignment[step][user] == 0)
+        model.AddExactlyOne(user_assignment[step])
 
     # Separation-of-duty constraints
+    # One clause per user authorised for both steps; any other user can never take both
     for (step1, step2) in instance.SOD:
-        for user in range(instance.number_of_users):
-            model.Add(user_assignment[step2][user] == 0).OnlyEnforceIf(user_assignment[step1][user])
+        for user in authorised_users[step1] & authorised_users[step2]:
+            model.AddBoolOr([user_assignment[step1][user].Not(), user_assignment[step2][user].Not()])
 
     # Binding-of-duty constraints
+    # Plain equalities (no reification) that presolve can merge; users authorised for neither step are 0 on both
     for (step1, step2) in instance.BOD:
-        for user in range(instance.number_of_users):
-            model.Add(user_assignment[step2][user] == 1).OnlyEnforceIf(user_assignment[step1][user])
+        for user in authorised_users[step1] | authorised_users[step2]:
+            model.Add(user_assignment[step2][user] == user_assignment[step1][user])
 
     # At-most-k constraints
+    separated_steps = {frozenset(steps) for steps in instance.SOD}
+    equal_steps = {}  # One equality boolean per step pair, shared by every combination containing it
     for (k, steps) in instance.at_most_k:
         
         # Get each combination of steps for length k + 1
@@ -171,49 +184,82 @@ def Solver(instance, filename):
             
             # Generate combinations of step pairs
             for (step1, step2) in itertools.combinations(steps_combination, 2):
-                
-                # Create a boolean variable to represent equality between assignments of two steps
-                bool_var = model.NewBoolVar(f'Equal_s{step1+1}_s{step2+1}')
-                
-                # Add a constraint that this boolean is true if the two steps are assigned to the same user
-                for user in range(instance.number_of_users):
-                    model.Add(user_assignment[step1][user] == user_assignment[step2][user]).OnlyEnforceIf(bool_var)
+
+                # Skip pairs that can never share a user (separation-of-duty or no common authorised user)
+                if frozenset((step1, step2)) in separated_steps or not authorised_users[step1] & authorised_users[step2]:
+                    continue
+
+                pair = (min(step1, step2), max(step1, step2))
+                if pair not in equal_steps:
+                    # Create a boolean variable to represent equality between assignments of two steps
+                    bool_var = model.NewBoolVar(f'Equal_s{pair[0]+1}_s{pair[1]+1}')
+                    
+                    # Add a constraint that this boolean is true if the two steps are assigned to the same user
+                    # (users authorised for neither step are already 0 on both, so they are skipped)
+                    for user in authorised_users[step1] | authorised_users[step2]:
+                        model.Add(user_assignment[step1][user] == user_assignment[step2][user]).OnlyEnforceIf(bool_var)
+                    equal_steps[pair] = bool_var
                 
                 # Append boolean variable to the list
-                is_bool.append(bool_var)
+                is_bool.append(equal_steps[pair])
             
-            # Require at least one of these booleans to be true
-            model.Add(sum(is_bool) >= 1)
+            # Require at least one of these booleans to be true (an empty clause is infeasible)
+            model.AddBoolOr(is_bool)
 
     # One-team constraints
     for (steps, teams) in instance.one_team:
+        # Identical teams are interchangeable; keep a single copy so the solver never
+        # enumerates symmetric team choices (and members are not tied to two flags)
+        teams = list({frozenset(team): team for team in teams}.values())
         team_flags = [model.NewBoolVar(f'team{t}') for t in range(len(teams))]
         model.AddExactlyOne(team_flags)
+
+        #steps cannot be assigned to users that are not listed in any team
+        users_in_teams = set(itertools.chain.from_iterable(teams))
+        for step in steps:
+            for user in range(instance.number_of_users):
+                if user not in users_in_teams:
+                    model.Add(user_assignment[step][user] == 0)
+
         for team_index in range (len(teams)):
             for step in steps:
                 for user in teams[team_index]:
                     model.Add(user_assignment[step][user] == 0).OnlyEnforceIf(team_flags[team_index].Not())
-            
-            #steps cannot be assigned to users that are not listed in team
-            users_in_teams = list(numpy.concatenate(teams).flat)
-            for step in steps:
-                for user in range(instance.number_of_users):
-                    if user not in users_in_teams:
-                        model.Add(user_assignment[step][user] == 0)
 
     # Max-load constraint
     max_steps_per_user = 10  # Set the maximum steps per user 
     for user in range(instance.number_of_users):
-        model.Add(sum(user_assignment[step][user] for step in range(instance.number_of_steps)) <= max_steps_per_user)
+        # Only the steps this user is authorised for can count towards the load
+        column = [user_assignment[step][user] for step in range(instance.number_of_steps) if user in authorised_users[step]]
+        if len(column) > max_steps_per_user:
+            model.Add(cp_model.LinearExpr.Sum(column) <= max_steps_per_user)
      
     # Solve the model
+    global _PROC
+    if _PROC is None:
+        import psutil
+        _PROC = psutil.Process()
+    process = _PROC
     start_time = currenttime() * 1000 #Execution time in ms
-    process = psutil.Process()
     start_memory = process.memory_info().rss / (1024 ** 2)  # Memory in MB
+    # Decide feasibility with the parallel portfolio first; enumeration has to stay on a single
+    # worker (several workers report the same solution more than once), so it only runs if satisfiable
     solver = cp_model.CpSolver()
-    solution_printer = VarArraySolutionPrinter(user_assignment, 1000)
-    solver.parameters.enumerate_all_solutions = True
-    status = solver.Solve(model, solution_printer)
+    solver.parameters.num_workers = os.cpu_count() or 1
+    status = solver.Solve(model)
+    solution_printer = VarArraySolutionPrinter(user_assignment, 1000, verbose=False)
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        # Start the enumeration from the plan already found (forbidden slots share one constant, hint it once)
+        hinted = set()
+        for row in user_assignment:
+            for var in row:
+                if var.Index() not in hinted:
+                    hinted.add(var.Index())
+                    model.AddHint(var, solver.BooleanValue(var))
+        solver = cp_model.CpSolver()
+        solver.parameters.enumerate_all_solutions = True
+        solver.parameters.linearization_level = 0  # The LP relaxation only slows down enumeration
+        status = solver.Solve(model, solution_printer)
     end_time = currenttime() * 1000#Execution time in ms
     end_memory = process.memory_info().rss / (1024 ** 2)  # Memory in MB
 
@@ -227,7 +273,11 @@ def Solver(instance, filename):
 
     if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
         result['sat'] = 'sat'
-        result['sol'] = [f's{s + 1}: u{u + 1}' for s in range(instance.number_of_steps) for u in range(instance.number_of_users) if solver.Value(user_assignment[s][u])]
+        # Fetch every variable value in one call, then pick the (step, user) cells that are set
+        values = np.asarray(solver.ResponseProto().solution)
+        indices = np.array([[var.Index() for var in row] for row in user_assignment])
+        steps, users = np.nonzero(values[indices])
+        result['sol'] = [f's{s + 1}: u{u + 1}' for s, u in zip(steps, users)]
         result['mul_sol'] = f'other solutions exist, {solution_printer.solution_count()} solutions found' if solution_printer.solution_count() > 1 else "this is the only solution"
 
     #Display in terminal just in case GUI does not work
@@ -240,6 +290,9 @@ def Solver(instance, filename):
 
 def create_gantt_chart(solution, instance):
     """Create and display a Gantt chart for the step-to-user assignments."""
+    import matplotlib.pyplot as plt
+    from tkinter import messagebox
+
     if not solution:
         messagebox.showerror("Error", "No solution available to generate Gantt chart. Run the solver first.")
         return
@@ -275,6 +328,8 @@ def create_gantt_chart(solution, instance):
 #Make constraints descriptions in GUI
 def show_constraints_description():
     """Display a pop-up window with descriptions of all constraints."""
+    import tkinter as tk
+
     description_window = tk.Toplevel()
     description_window.title("Constraints Description")
 
@@ -306,6 +361,9 @@ def show_constraints_description():
 
 #Function to run gui
 def run_gui():
+    import tkinter as tk
+    from tkinter import filedialog, messagebox, scrolledtext
+
     def select_file():
         filename = filedialog.askopenfilename(title="Select an instance file")
         if filename:
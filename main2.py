@@ -1,17 +1,35 @@
 import itertools
-import re
+import json
+import os
+import sys
 import numpy
 from z3 import *
 from time import time as currenttime
-import psutil
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+from wsp_numba import prune
 
 # Helper function for formatting solver output
 def transform_output(d):
     crlf = '\r\n'
     # Combine solution, satisfiability status, and execution time into a formatted string
-    s = ''.join(kk + crlf for kk in d['sol'])
-    s = d['sat'] + crlf + s + d['mul_sol']
-    return crlf + s + crlf + str(d['exe_time']) if 'exe_time' in d else s
+    lines = [d['sat'], *d['sol'], d['mul_sol']]
+    if 'exe_time' in d:
+        return crlf + crlf.join(lines + [str(d['exe_time'])])
+    return crlf.join(lines)
+
+# Peak memory of the whole process so far, formatted for the result dict
+def peak_memory_usage():
+    if resource is None:
+        import psutil
+        info = psutil.Process().memory_info()
+        peak = getattr(info, 'peak_wset', info.rss) / (1024 ** 2)  # Windows reports its peak working set
+    else:
+        # ru_maxrss is in bytes on macOS and in KB elsewhere
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 ** 2 if sys.platform == 'darwin' else 1024)
+    return f'Peak memory (process): {peak:.2f}MB'
 
 # Instance class to hold problem details
 class Instance:
@@ -25,19 +43,61 @@ class Instance:
         self.at_most_k = []  # At-most-k constraints
         self.one_team = []  # One-team constraints
 
+# Parse cache for read_file: the instance is stored as plain JSON data next to the input file
+# (never as a pickled object, so loading a cache cannot run code and does not depend on the module name)
+_CACHE_VERSION = 1  # Bump whenever the parsing rules or the Instance fields change
+
+def _read_cache(cache_path, source):
+    try:
+        with open(cache_path) as cache:
+            data = json.load(cache)
+        if data.get('version') != _CACHE_VERSION or data['source'] != source:
+            return None
+        instance = Instance()
+        instance.number_of_steps = data['number_of_steps']
+        instance.number_of_users = data['number_of_users']
+        instance.number_of_constraints = data['number_of_constraints']
+        instance.auth = data['auth']
+        instance.SOD = [tuple(steps) for steps in data['SOD']]
+        instance.BOD = [tuple(steps) for steps in data['BOD']]
+        instance.at_most_k = [(k, steps) for (k, steps) in data['at_most_k']]
+        instance.one_team = [(steps, teams) for (steps, teams) in data['one_team']]
+        return instance
+    except (OSError, ValueError, KeyError, TypeError):
+        return None  # Missing, stale or malformed cache: the file is simply re-parsed
+
+def _write_cache(cache_path, source, instance):
+    data = {'version': _CACHE_VERSION, 'source': source, **vars(instance)}
+    try:
+        with open(cache_path, 'w') as cache:
+            json.dump(data, cache)
+    except OSError:
+        pass  # Caching is only an optimisation; a read-only directory is fine
+
 # Function to read the problem instance from a file
-def read_file(filename):
+def read_file(filename, cache=True):
     def read_attribute(name):
-        # Read a named attribute from the file and parse it as an integer
+        # Read a named attribute ("<name>: <n>") from the file and parse it as an integer
         line = f.readline()
-        match = re.match(f'{name}:\s*(\d+)$', line)
-        if match:
-            return int(match.group(1))
+        key, _, value = line.partition(b':')
+        if key.strip() == name.encode() and value.strip().isdigit():
+            return int(value)
         else:
-            raise Exception(f"Could not parse line {line}; expected the {name} attribute")
+            raise Exception(f"Could not parse line {line.decode()}; expected the {name} attribute")
+
+    # Reuse the parsed instance only if the cache was written for exactly this file version: the source's
+    # mtime (ns) and size are stored with it, so an older or replaced file is never matched by timestamp order.
+    # cache=False always parses the file and leaves no cache behind
+    cache_path = filename + '.cache.json'
+    stat = os.stat(filename)
+    source = [stat.st_mtime_ns, stat.st_size]
+    if cache and (instance := _read_cache(cache_path, source)) is not None:
+        return instance
 
     instance = Instance()
-    with open(filename) as f:
+    # The grammar is plain whitespace-separated tokens, so each line is split and dispatched on its
+    # first word; tokens such as b's12' or b'u7' are parsed by int() on the bytes after the prefix
+    with open(filename, 'rb') as f:
         # Read basic problem details
         instance.number_of_steps = read_attribute("#Steps")
         instance.number_of_users = read_attribute("#Users")
@@ -47,49 +107,54 @@ def read_file(filename):
         # Parse each constraint in the file
         for _ in range(instance.number_of_constraints):
             l = f.readline()
+            tokens = l.split()
+            kind = tokens[0] if tokens else b''
 
             # Parse authorizations
-            if m := re.match(r"Authorisations u(\d+)(?: s\d+)*", l):
-                user_id = int(m.group(1))
-                steps = [-1]
-                for m in re.finditer(r's(\d+)', l):
-                    if -1 in steps:
-                        steps.remove(-1)
-                    steps.append(int(m.group(1)) - 1)
+            if kind == b'Authorisations':
+                user_id = int(tokens[1][1:])
+                # A user listed without steps is authorised for none (marked by -1)
+                steps = [int(step[1:]) - 1 for step in tokens[2:]] or [-1]
                 instance.auth[user_id - 1].extend(steps)
                 continue
 
             # Parse separation-of-duty constraints
-            if m := re.match(r"Separation-of-duty s(\d+) s(\d+)", l):
-                steps = (int(m.group(1)) - 1, int(m.group(2)) - 1)
+            if kind == b'Separation-of-duty':
+                steps = (int(tokens[1][1:]) - 1, int(tokens[2][1:]) - 1)
                 instance.SOD.append(steps)
                 continue
 
             # Parse binding-of-duty constraints
-            if m := re.match(r"Binding-of-duty s(\d+) s(\d+)", l):
-                steps = (int(m.group(1)) - 1, int(m.group(2)) - 1)
+            if kind == b'Binding-of-duty':
+                steps = (int(tokens[1][1:]) - 1, int(tokens[2][1:]) - 1)
                 instance.BOD.append(steps)
                 continue
 
             # Parse at-most-k constraints
-            if m := re.match(r"At-most-k (\d+) (s\d+)(?: (s\d+))*", l):
-                k = int(m.group(1))
-                steps = [int(m.group(1)) - 1 for m in re.finditer(r's(\d+)', l)]
+            if kind == b'At-most-k':
+                k = int(tokens[1])
+                steps = [int(step[1:]) - 1 for step in tokens[2:]]
                 instance.at_most_k.append((k, steps))
                 continue
 
-            # Parse one-team constraints
-            if m := re.match(r"One-team\s+(s\d+)(?:\s+s\d+)*(\s+\(u\d+(?:\s+u\d+)*\))+", l):
-                steps = [int(step.group(1)) - 1 for step in re.finditer(r's(\d+)', l)]
+            # Parse one-team constraints: the steps come first, then each team as (u1 u2 ...)
+            if kind == b'One-team':
+                steps = []
                 teams = []
-                for team_match in re.finditer(r'\((u\d+(?:\s+u\d+)*)\)', l):
-                    team = [int(user.group(1)) - 1 for user in re.finditer(r'u(\d+)', team_match.group(1))]
-                    teams.append(team)
+                for token in tokens[1:]:
+                    if token.startswith(b'('):
+                        teams.append([])
+                    if teams:
+                        teams[-1].append(int(token.strip(b'()')[1:]) - 1)
+                    else:
+                        steps.append(int(token[1:]) - 1)
                 instance.one_team.append((steps, teams))
                 continue
 
-            raise Exception(f'Failed to parse this line: {l}')
+            raise Exception(f'Failed to parse this line: {l.decode()}')
 
+    if cache:
+        _write_cache(cache_path, source, instance)
     return instance
 
 # Function to solve the workflow satisfiability problem using Z3
@@ -107,64 +172,98 @@ def Solver_z3(instance, filename):
     print("=====================================================")
 
     # Create Z3 solver
-    s = Solver()
-    
+    # The model is purely finite-domain (Booleans, small bitvectors and cardinalities), so it is simplified,
+    # the cardinalities and bitvectors are bit-blasted and the result goes straight to the SAT solver
+    s = Then('simplify', 'propagate-values', 'solve-eqs', 'card2bv', 'bit-blast', 'sat').solver()
+
     # Create Boolean variables for user assignments
-    user_assignment = [[Bool(f's{s + 1}_u{u + 1}') 
+    # Only authorised (step, user) pairs get a variable; every other slot is the constant False,
+    # which Z3 folds away inside the constraints below (users with no authorisation rule may do any step)
+    allowed = numpy.ones((instance.number_of_users, instance.number_of_steps), dtype=bool)
+    for (user, steps) in enumerate(instance.auth):
+        if steps:
+            allowed[user, :] = False
+            allowed[user, [step for step in steps if step != -1]] = True  # -1 marks a user banned from every step
+
+    # Prune the mask with SOD/BOD propagation first; if a step is left without users there is no plan
+    # and the Z3 model is not built at all
+    propagate_start = currenttime() * 1000
+    if not prune(allowed, instance.SOD, instance.BOD):
+        return {
+            'sat': 'unsat',
+            'sol': [],
+            'mul_sol': '',
+            'exe_time': f'Time taken: {int(currenttime() * 1000 - propagate_start)}ms',
+            'memory_usage': peak_memory_usage()
+        }
+
+    user_assignment = [[Bool(f's{s + 1}_u{u + 1}') if allowed[u, s] else BoolVal(False)
                        for u in range(instance.number_of_users)] 
                       for s in range(instance.number_of_steps)]
 
-    # Ensure each step is assigned to exactly one user
+    # Channel each step's authorised users to a bitvector holding the index of its assigned user
+    step_users = [numpy.flatnonzero(allowed[:, step]) for step in range(instance.number_of_steps)]
+    bv_width = max(1, instance.number_of_users.bit_length())
+    step_user_bv = [BitVec(f'step_{step + 1}', bv_width) for step in range(instance.number_of_steps)]
     for step in range(instance.number_of_steps):
-        s.add(Or(user_assignment[step]))  # At least one user is assigned to the step
-        s.add(AtMost(*user_assignment[step], 1))  # At most one user is assigned to the step
+        s.add(And([ULT(step_user_bv[step], instance.number_of_users)] +
+                  [user_assignment[step][user] == (step_user_bv[step] == int(user)) for user in step_users[step]]))
 
-    # Authorization constraints
-    for user in range(instance.number_of_users):
-        if instance.auth[user]:
-            for step in range(instance.number_of_steps):
-                if step not in instance.auth[user]:
-                    s.add(Not(user_assignment[step][user]))
+    # Ensure each step is assigned to exactly one user
+    # (the propagation above guarantees every step has at least one authorised user)
+    s.add(And([PbEq([(user_assignment[step][user], 1) for user in step_users[step]], 1)
+               for step in range(instance.number_of_steps)]))
 
     # Separation-of-duty constraints
+    # Only users allowed on both steps can break the constraint, so the others build no term at all
     for (step1, step2) in instance.SOD:
         s.add(And([Not(And(user_assignment[step1][user], user_assignment[step2][user]))
-                for user in range(instance.number_of_users)]))
+                for user in numpy.intersect1d(step_users[step1], step_users[step2])]))
 
     # Binding-of-duty constraints
     for (step1, step2) in instance.BOD:
-        for user in range(instance.number_of_users):
-            s.add(user_assignment[step1][user] == user_assignment[step2][user])
+        s.add(step_user_bv[step1] == step_user_bv[step2])
 
     # At-Most-K constraints
+    # Among any k + 1 steps of the group at least two must share a user.
+    # Each Equal_ pair is defined once, over the users allowed on either step, and reused across combinations;
+    # the disjunction is posted as a clause rather than a Sum of If terms so Z3 stays in propositional reasoning
+    equal_steps = {}
     for (k, steps) in instance.at_most_k: 
         for steps_combination in itertools.combinations(steps, k + 1):    
             is_bool = []   
             for (step1, step2) in itertools.combinations(steps_combination, 2):
-                bool_var = Bool(f'Equal_s{step1+1}_s{step2+1}')
-                for user in range(instance.number_of_users):
-                    s.add(Implies(bool_var, user_assignment[step1][user] == user_assignment[step2][user]))
-                is_bool.append(bool_var)
-            s.add(Sum([If(b, 1, 0) for b in is_bool]) >= 1)
+                if (step1, step2) not in equal_steps:
+                    bool_var = Bool(f'Equal_s{step1+1}_s{step2+1}')
+                    s.add(And([Implies(bool_var, user_assignment[step1][user] == user_assignment[step2][user])
+                               for user in numpy.union1d(step_users[step1], step_users[step2])]))
+                    equal_steps[(step1, step2)] = bool_var
+                is_bool.append(equal_steps[(step1, step2)])
+            s.add(Or(is_bool))
 
     # One-team constraints
+    # Team members who are not authorised for a step are left out of that step's disjunction;
+    # a team with no authorised member for some step can never be chosen, so it is dropped
     for (steps, teams) in instance.one_team:
         team_conditions = []
         for team in teams:
-            team_condition = And([Or([user_assignment[step][user] for user in team]) for step in steps])
+            team_auth = [[user for user in team if allowed[user, step]] for step in steps]
+            if not all(team_auth):
+                continue
+            team_condition = And([Or([user_assignment[step][user] for user in users])
+                                  for (step, users) in zip(steps, team_auth)])
             team_conditions.append(team_condition)
         s.add(Or(team_conditions))
 
     # Maximum workload constraint
+    # Counted over the steps a user is authorised for; users who cannot exceed the limit need no constraint
     max_workload = 10
-    for user in range(instance.number_of_users):
-        s.add(Sum([If(user_assignment[step][user], 1, 0) 
-                  for step in range(instance.number_of_steps)]) <= max_workload)
+    workloads = [[(user_assignment[step][user], 1) for step in range(instance.number_of_steps) if allowed[user, step]]
+                 for user in range(instance.number_of_users)]
+    s.add(And([PbLe(workload, max_workload) for workload in workloads if len(workload) > max_workload]))
 
     # Solve and process results
     start_time = currenttime() * 1000
-    process = psutil.Process()
-    start_memory = process.memory_info().rss / (1024 ** 2)  # Memory in MB
     result = {
         'sat': 'unsat',
         'sol': [],
@@ -176,48 +275,50 @@ def Solver_z3(instance, filename):
     if s.check() == sat:
         result['sat'] = 'Status: Satisfiable'
         m = s.model()
-        
-        # Extract solution
-        solution = []
+    
+        # Extract solution from the step_ bitvectors; steps the simplifier eliminated are evaluated
+        assigned = {}
+        for decl in m.decls():
+            if decl.name().startswith('step_'):
+                assigned[int(decl.name()[len('step_'):]) - 1] = m[decl].as_long()
         for step in range(instance.number_of_steps):
-            for user in range(instance.number_of_users):
-                if is_true(m.evaluate(user_assignment[step][user])):
-                    solution.append(f's{step + 1}: u{user + 1}')
-        result['sol'] = solution
+            if step not in assigned:
+                assigned[step] = m.eval(step_user_bv[step], model_completion=True).as_long()
+        result['sol'] = [f's{step + 1}: u{assigned[step] + 1}' for step in range(instance.number_of_steps)]
 
         # Check for multiple solutions
-        block = []
-        for step in range(instance.number_of_steps):
-            for user in range(instance.number_of_users):
-                if is_true(m.evaluate(user_assignment[step][user])):
-                    block.append(Not(user_assignment[step][user]))
-                else:
-                    block.append(user_assignment[step][user])
+        # Another solution must give some step a different user; the blocking clause lives in its own scope
+        # so the solver is left as it was after the first check
+        block = [step_user_bv[step] != assigned[step] for step in range(instance.number_of_steps)]
+        s.push()
         s.add(Or(block))
+        second = s.check()
+        s.pop()
 
-        if s.check() == sat:
+        if second == sat:
             result['mul_sol'] = f"other solutions exist, 2 solutions found"
         else:
             result['mul_sol'] = "this is the only solution"
 
     end_time = currenttime() * 1000
-    end_memory = process.memory_info().rss / (1024 ** 2)  # Memory in MB
 
     result['exe_time'] = f'Time taken: {int(end_time - start_time)}ms'
-    result['memory_usage'] = f'Memory usage: {end_memory - start_memory:.2f}MB'
+    result['memory_usage'] = peak_memory_usage()
 
     return result
 
 if __name__ == '__main__':
-    dpath = 'instances/5-constraint/2.txt'
-    inst = read_file(dpath)
-    result = Solver_z3(inst, dpath)
-
-    print(f"Instance Tested: {dpath}")
-    print("Solver Results:")
-    print(f"{result['sat']}")
-    for sol in result['sol']:
-        print(sol)
-    print(result['mul_sol'])
-    print(result['exe_time'])
-    print(result['memory_usage'])
+    # Any number of instance files may be given; they are solved one after another
+    dpaths = sys.argv[1:] or ['instances/5-constraint/2.txt']
+    for dpath in dpaths:
+        inst = read_file(dpath)
+        result = Solver_z3(inst, dpath)
+
+        print(f"Instance Tested: {dpath}")
+        print("Solver Results:")
+        print(f"{result['sat']}")
+        for sol in result['sol']:
+            print(sol)
+        print(result['mul_sol'])
+        print(result['exe_time'])
+        print(result['memory_usage'])
@@ -0,0 +1,80 @@
+import numpy as np
+from numba import njit
+
+# Pre-SAT filter for the workflow satisfiability problem.
+# The users allowed on each step are packed into uint64 bitsets, bits[step, word], 64 users per word,
+# and pruned using the SOD/BOD constraints until nothing changes:
+#   - Binding-of-duty: both steps keep only the users allowed on both of them (one AND per 64 users)
+#   - Separation-of-duty: a step left with a single user removes that user from the other step
+# Only assignments that cannot appear in any plan are removed, so the reduced sets can be handed to the solver.
+# Returns False as soon as some step has no user left, i.e. the instance is unsatisfiable.
+@njit(cache=True, boundscheck=False)
+def propagate(bits, sod_pairs, bod_pairs):
+    number_of_steps, words = bits.shape
+    one = np.uint64(1)
+    changed = True
+    while changed:
+        changed = False
+
+        # Binding-of-duty: intersect the two steps' user sets
+        for i in range(bod_pairs.shape[0]):
+            step1 = bod_pairs[i, 0]
+            step2 = bod_pairs[i, 1]
+            for w in range(words):
+                both = bits[step1, w] & bits[step2, w]
+                if both != bits[step1, w] or both != bits[step2, w]:
+                    bits[step1, w] = both
+                    bits[step2, w] = both
+                    changed = True
+
+        # Separation-of-duty: a step fixed to one user excludes that user from the other step
+        for i in range(sod_pairs.shape[0]):
+            for side in range(2):
+                fixed_step = sod_pairs[i, side]
+                other_step = sod_pairs[i, 1 - side]
+                count = 0
+                last_word = -1
+                for w in range(words):
+                    word = bits[fixed_step, w]
+                    if word != 0:
+                        # A word with more than one bit set (word & (word - 1) != 0) already means several users
+                        count += 1 if word & (word - one) == 0 else 2
+                        last_word = w
+                        if count > 1:
+                            break
+                if count == 0:
+                    return False
+                if count == 1 and bits[other_step, last_word] & bits[fixed_step, last_word] != 0:
+                    bits[other_step, last_word] &= ~bits[fixed_step, last_word]
+                    changed = True
+
+    # Every step must still have at least one candidate user
+    for step in range(number_of_steps):
+        empty = True
+        for w in range(words):
+            if bits[step, w] != 0:
+                empty = False
+                break
+        if empty:
+            return False
+    return True
+
+
+# Prune allowed[user, step] in place with propagate; returns False when the instance is unsatisfiable
+def prune(allowed, SOD, BOD):
+    number_of_users = allowed.shape[0]
+    words = (number_of_users + 63) // 64
+    # Pack each step's column into bytes, padded to whole uint64 words; propagate only ANDs, clears
+    # and tests words, never a user's bit position, so the byte order of the view does not matter
+    packed = np.zeros((allowed.shape[1], words * 8), dtype=np.uint8)
+    packed[:, :(number_of_users + 7) // 8] = np.packbits(allowed.T, axis=1, bitorder='little')
+    bits = packed.view(np.uint64)
+
+    feasible = propagate(bits, _step_pairs(SOD), _step_pairs(BOD))
+    allowed[:] = np.unpackbits(packed, axis=1, count=number_of_users, bitorder='little').T.astype(bool)
+    return feasible
+
+
+# Turn a list of (step1, step2) constraints into the array layout propagate expects
+def _step_pairs(pairs):
+    return np.array(pairs, dtype=np.int64).reshape(-1, 2)